@@ -5,24 +5,24 @@ arrival, and departures by time bin of day and date.
 
 # Copyright 2022-2023 Mark Isken
 
+import functools
 import logging
 from typing import List
 
+from numba import get_num_threads, njit, prange
 import numpy as np
 import pandas as pd
-from pandas import DataFrame
 from pandas import Series
 from pandas import Timestamp
 from pandas.tseries.offsets import Minute
 
 import hillmaker.hmlib as hmlib
 
-CONST_FAKE_OCCWEIGHT_FIELDNAME = 'FakeOccWeightField'
-CONST_FAKE_CATFIELD_NAME = 'FakeCatForTotals'
 TOTAL_STR = 'total'
 OCC_TOLERANCE = 0.02
 EARLY_START_ANALYSIS_TOLERANCE = 48.0
 LATE_END_ANALYSIS_TOLERANCE = 48.0
+MIN_STOPS_PER_PIECE = 50000
 
 # This should inherit level from root logger
 logger = logging.getLogger(__name__)
@@ -87,6 +87,14 @@ def make_bydatetime(stops_df: pd.DataFrame, infield: str, outfield: str,
     Dict of DataFrames
        Occupancy, arrivals, departures by category by datetime bin
 
+    Notes
+    -----
+    Occupancy is computed by a parallel numba kernel. When TBB is installed numba uses its TBB
+    threading layer, which is not fork safe: a process that forks (e.g. a fork based
+    multiprocessing pool) after this function has run can hang at exit. Set the environment variable
+    ``NUMBA_THREADING_LAYER=workqueue`` in that case. The workqueue layer does not allow this function
+    to be called concurrently from several threads.
+
     Examples
     --------
     bydt_dfs = make_bydatetime(stops_df, 'InTime', 'OutTime',
@@ -96,135 +104,135 @@ def make_bydatetime(stops_df: pd.DataFrame, infield: str, outfield: str,
     # Number of bins in analysis span
     num_bins = hmlib.bin_of_analysis_range(end_analysis_np, start_analysis_np, highres_bin_size_minutes) + 1
 
+    # All bin and occupancy arithmetic is done on int64 nanoseconds since the epoch
+    start_analysis_ns = np.datetime64(start_analysis_np, 'ns').astype(np.int64)
+    end_analysis_ns = np.datetime64(end_analysis_np, 'ns').astype(np.int64)
+    in_ns = stops_df[infield].to_numpy().astype('datetime64[ns]', copy=False).view(np.int64)
+    out_ns = stops_df[outfield].to_numpy().astype('datetime64[ns]', copy=False).view(np.int64)
+
     # Compute min and max of in and out times
     min_intime = stops_df[infield].min()
     max_intime = stops_df[infield].max()
     min_outtime = stops_df[outfield].min()
     max_outtime = stops_df[outfield].max()
 
-    logger.debug(f"min of intime: {min_intime}")
-    logger.debug(f"max of intime: {max_intime}")
-    logger.debug(f"min of outtime: {min_outtime}")
-    logger.debug(f"max of outtime: {max_outtime}")
+    logger.debug("min of intime: %s", min_intime)
+    logger.debug("max of intime: %s", max_intime)
+    logger.debug("min of outtime: %s", min_outtime)
+    logger.debug("max of outtime: %s", max_outtime)
 
     # Check for mismatch between analysis dates and dates in stops_df
     check_date_ranges(start_analysis_np, end_analysis_np, min_intime, max_outtime)
-    logger.debug(
-        f'start analysis: {np.datetime_as_string(start_analysis_np, unit="D")}, end analysis: {np.datetime_as_string(end_analysis_np, unit="D")}')
+    logger.debug('start analysis: %s, end analysis: %s',
+                 np.datetime_as_string(start_analysis_np, unit="D"), np.datetime_as_string(end_analysis_np, unit="D"))
 
     # Occupancy weights
-    # If no occ weight field specified, create fake one containing 1.0 as values.
-    # Avoids having to check during dataframe iteration whether to use
-    # default occupancy weight.
+    # If no occ weight field specified, use an array of 1.0 values. Only the numpy array is
+    # needed, so there is no need to add a column to (and thereby copy) stops_df.
+    # The weights are read in single precision where that is exact (the default weights of 1.0,
+    # or a float32 weight column) to halve the bytes read. Occupancy is always accumulated in
+    # double precision.
     if occ_weight_field is None:
-        occ_weight_vec = np.ones(len(stops_df.index), dtype=np.float64)
-        occ_weight_df = DataFrame({CONST_FAKE_OCCWEIGHT_FIELDNAME: occ_weight_vec})
-        stops_df = pd.concat([stops_df, occ_weight_df], axis=1)
-        occ_weight_field = CONST_FAKE_OCCWEIGHT_FIELDNAME
+        occ_weight = np.ones(len(stops_df.index), dtype=np.float32)
+    else:
+        occ_weight = stops_df[occ_weight_field].to_numpy()
+        if occ_weight.dtype != np.float32:
+            occ_weight = occ_weight.astype(np.float64, copy=False)
 
     # Handle cases of no catfield, or a single fieldname, (no longer supporting a list of fieldnames)
-    # If no category, add a temporary dummy column populated with a totals str
-
-    # do_totals = True
+    # If no category, all stop records are treated as a single category of totals
     if cat_field is not None:
         has_cat_field = True
         # If catfield a string, convert to list
         # Keeping catfield as a list in case I change mind about multiple category fields
         if isinstance(cat_field, str):
             cat_field = [cat_field]
-    else:
-        # No category field, create fake category field containing a single value
-        has_cat_field = False
-        tot_list = [TOTAL_STR] * len(stops_df)
-        tot_series = Series(tot_list, dtype=str, name=CONST_FAKE_CATFIELD_NAME)
-        tot_field_df = DataFrame({CONST_FAKE_CATFIELD_NAME: tot_series})
-        stops_df = pd.concat([stops_df, tot_field_df], axis=1)
-        cat_field = [CONST_FAKE_CATFIELD_NAME]
-        # do_totals = False
-
-    # Get the unique category values and exclude any specified to exclude
-    categories = []
-    if isinstance(cat_to_exclude, str):
-        cat_to_exclude = [cat_to_exclude]
-
-    if cat_to_exclude is not None and len(cat_to_exclude) > 0:
-        for i in range(len(cat_field)):
-            categories.append(tuple([c for c in stops_df[cat_field[i]].unique() if c not in cat_to_exclude]))
-    else:
-        for i in range(len(cat_field)):
-            categories.append(tuple([c for c in stops_df[cat_field[i]].unique()]))
 
-    for i in range(len(cat_field)):
-        stops_df = stops_df[stops_df[cat_field[i]].isin(categories[i])]
+        # TEMPORARY ASSUMPTION - only a single category field is allowed
+        # Sort the stop records by category so that the records for each category are a contiguous
+        # slice of the numpy arrays. Avoids filtering stops_df once per category.
+        cat_codes, cat_values = pd.factorize(stops_df[cat_field[0]])
+        sort_order = np.argsort(cat_codes, kind='stable')
+        cat_bounds = np.searchsorted(cat_codes[sort_order], np.arange(len(cat_values) + 1))
+
+        # The unique category values come from factorizing, exclude any specified to exclude
+        if isinstance(cat_to_exclude, str):
+            cat_to_exclude = [cat_to_exclude]
 
-    # TEMPORARY ASSUMPTION - only a single category field is allowed
-    # Main loop over the categories. Filter stops_df by category and then do
-    # numpy based occupancy computations.
+        if cat_to_exclude is not None and len(cat_to_exclude) > 0:
+            categories = [tuple([c for c in cat_values if c not in cat_to_exclude])]
+        else:
+            categories = [tuple(cat_values)]
+    else:
+        # No category field, the whole of stops_df is a single slice
+        has_cat_field = False
+        categories = [(TOTAL_STR,)]
+        cat_values = [TOTAL_STR]
+        sort_order = slice(None)
+        cat_bounds = [0, len(stops_df)]
+
+    # Put infield, outfield and occ_weight arrays in category order
+    in_ns_all = in_ns[sort_order]
+    out_ns_all = out_ns[sort_order]
+    occ_weight_all = occ_weight[sort_order]
+
+    # Compute entry and exit bins and fractions and do the occupancy, arrival and departure
+    # incrementing in a single pass over the stop records. Categories are processed in parallel.
+    # Categories with many stops are split into pieces so that a single large category (e.g. the
+    # totals when there is no category field) is also spread over the available threads.
+    cat_indices = np.asarray([k for k, cat in enumerate(cat_values) if cat in categories[0]], dtype=np.int64)
+    if len(cat_indices) == 0:
+        raise ValueError(f'No categories of {cat_field[0]} left to analyze (cat_to_exclude={cat_to_exclude})')
+
+    cat_starts = np.asarray(cat_bounds, dtype=np.int64)[cat_indices]
+    cat_ends = np.asarray(cat_bounds, dtype=np.int64)[cat_indices + 1]
+    piece_starts, piece_ends, first_piece = split_categories(cat_starts, cat_ends, get_num_threads(),
+                                                             MIN_STOPS_PER_PIECE)
+
+    # Arrivals, departures and occupancy by bin for each piece. Allocated once and filled in place.
+    # Arrivals and departures are counts and are kept as integers until the DataFrames are built.
+    arr_all = np.zeros((len(piece_starts), num_bins), dtype=np.int32)
+    dep_all = np.zeros((len(piece_starts), num_bins), dtype=np.int32)
+    occ_all = np.zeros((len(piece_starts), num_bins), dtype=np.float64)
+
+    accumulate = accumulate_kernel(highres_bin_size_minutes * 60 * 10 ** 9)
+    accumulate(in_ns_all, out_ns_all, occ_weight_all, start_analysis_ns, piece_starts, piece_ends,
+               num_bins, edge_bins, occ_all, arr_all, dep_all)
+
+    # Combine the pieces of split categories
+    if len(piece_starts) > len(cat_starts):
+        arr_all = np.add.reduceat(arr_all, first_piece, axis=0)
+        dep_all = np.add.reduceat(dep_all, first_piece, axis=0)
+        occ_all = np.add.reduceat(occ_all, first_piece, axis=0)
+
+    # Main loop over the categories for logging and conservation of flow checks
     results = {}
-    for cat in categories[0]:
-        cat_df = stops_df[stops_df[cat_field[0]] == cat]
-        num_stop_recs = len(cat_df)
-
-        # Convert Series to numpy arrays for infield, outfield, occ_weight
-        in_ts_np = cat_df[infield].to_numpy()
-        out_ts_np = cat_df[outfield].to_numpy()
-        occ_weight = cat_df[occ_weight_field].to_numpy()
-
-        # Compute entry and exit bin arrays
-        entry_bin = hmlib.bin_of_analysis_range(in_ts_np, start_analysis_np, highres_bin_size_minutes)
-        logger.debug(f'min of entry time_bin = {np.amin(entry_bin)}')
-        exit_bin = hmlib.bin_of_analysis_range(out_ts_np, start_analysis_np, highres_bin_size_minutes)
-        logger.debug(f'max of exit time_bin = {np.amax(exit_bin)} and num_bins={num_bins}')
-
-        # Compute inbin and outbin fraction arrays
-        entry_bin_frac = in_bin_occ_frac(entry_bin, in_ts_np, out_ts_np,
-                                         start_analysis_np, highres_bin_size_minutes, edge_bins=edge_bins)
-        exit_bin_frac = out_bin_occ_frac(exit_bin, in_ts_np, out_ts_np,
-                                         start_analysis_np, highres_bin_size_minutes, edge_bins=edge_bins)
-
-        # Create list of occupancy incrementer arrays
-        list_of_inc_arrays = [make_occ_inc(entry_bin[i], exit_bin[i],
-                                           entry_bin_frac[i], exit_bin_frac[i],
-                                           occ_weight[i]) for i in range(num_stop_recs)]
-
-        # Create array of stop record types
-        rec_type = cat_df.apply(lambda x:
-                                hmlib.stoprec_relationship_type(x[infield], x[outfield],
-                                                                start_analysis_np, end_analysis_np), axis=1).to_numpy()
-
-        # Do the occupancy incrementing
-        rec_counts = update_occ_incs(entry_bin, exit_bin, list_of_inc_arrays, rec_type, num_bins)
-        logger.debug(f'cat {cat} {rec_counts}')
-
-        occ = np.zeros(num_bins, dtype=np.float64)
-        update_occ(occ, entry_bin, rec_type, list_of_inc_arrays)
-
-        # Count unadjusted arrivals and departures by bin
-        arr = np.bincount(entry_bin, minlength=num_bins).astype(np.float64)
-        dep = np.bincount(exit_bin, minlength=num_bins).astype(np.float64)
-
-        # Adjust the arrival and departure counts to account for rec_types left, right, and outer
-        arr[0] -= rec_counts.get('left', 0)
-        arr[0] -= rec_counts.get('outer', 0)
-        dep[num_bins - 1] -= rec_counts.get('right', 0)
-        dep[num_bins - 1] -= rec_counts.get('outer', 0)
-
-        # Combine arr, dep, occ (in that order) into matrix
-        arr_dep_occ = np.column_stack((arr, dep, occ))
+    for j, k in enumerate(cat_indices):
+        cat = cat_values[k]
+        cat_slice = slice(cat_bounds[k], cat_bounds[k + 1])
+        in_ns_cat = in_ns_all[cat_slice]
+        out_ns_cat = out_ns_all[cat_slice]
+        occ_weight = occ_weight_all[cat_slice]
+
+        if logger.isEnabledFor(logging.DEBUG):
+            rec_type = hmlib.stoprec_relationship_codes(in_ns_cat, out_ns_cat, start_analysis_ns, end_analysis_ns)
+            rec_counts = dict(zip(hmlib.RECTYPE_NAMES, np.bincount(rec_type, minlength=len(hmlib.RECTYPE_NAMES))))
+            logger.debug('cat %s %s', cat, rec_counts)
+
+        arr = arr_all[j]
+        dep = dep_all[j]
+        occ = occ_all[j]
 
         # Conservation of flow checks for num arrivals and departures
         num_arrivals_hm = arr.sum()
         num_departures_hm = dep.sum()
 
-        num_arrivals_stops = cat_df.loc[(cat_df[infield] >= start_analysis_np) &
-                                        (cat_df[infield] <= end_analysis_np)].index.size
-
-        num_departures_stops = cat_df.loc[(cat_df[outfield] >= start_analysis_np) &
-                                          (cat_df[outfield] <= end_analysis_np)].index.size
+        num_arrivals_stops = np.count_nonzero((in_ns_cat >= start_analysis_ns) & (in_ns_cat <= end_analysis_ns))
+        num_departures_stops = np.count_nonzero((out_ns_cat >= start_analysis_ns) & (out_ns_cat <= end_analysis_ns))
 
-        logger.debug(f'cat {cat} num_arrivals_hm {num_arrivals_hm:.0f} num_arrivals_stops {num_arrivals_stops}')
-        logger.debug(
-            f'cat {cat} num_departures_hm {num_departures_hm:.0f} num_departures_stops {num_departures_stops}')
+        logger.debug('cat %s num_arrivals_hm %.0f num_arrivals_stops %d', cat, num_arrivals_hm, num_arrivals_stops)
+        logger.debug('cat %s num_departures_hm %.0f num_departures_stops %d',
+                     cat, num_departures_hm, num_departures_stops)
 
         if num_arrivals_hm != num_arrivals_stops:
             logger.warning(
@@ -237,27 +245,25 @@ def make_bydatetime(stops_df: pd.DataFrame, infield: str, outfield: str,
         # Conservation of flow checks for weighted occupancy
         tot_occ_him = occ.sum()
 
-        tot_occ_mins_stops = \
-            (cat_df[occ_weight_field] * (cat_df[outfield] - cat_df[infield]).dt.total_seconds()).sum() / 60
+        tot_occ_mins_stops = (occ_weight * ((out_ns_cat - in_ns_cat) / 10 ** 9)).sum() / 60
         tot_occ_stops = tot_occ_mins_stops / highres_bin_size_minutes
 
-        logger.debug(f'cat {cat} tot_occ_hm {tot_occ_him:.2f} tot_occ_stops {tot_occ_stops:.2f}')
+        logger.debug('cat %s tot_occ_hm %.2f tot_occ_stops %.2f', cat, tot_occ_him, tot_occ_stops)
         if (tot_occ_him - tot_occ_stops) / tot_occ_stops > OCC_TOLERANCE:
             logger.warning(
                 f'cat {cat} Weighted occupancy differs by more than {OCC_TOLERANCE})')
 
         # Store results
-        results[cat] = arr_dep_occ
-
-    # Convert stacked arrays to Dataframes. Result is dict with keys 'agg' and 'res'
-    bydt_dfs_cat = arrays_to_df(results, start_analysis_np, end_analysis_np,
-                                bin_size_minutes, highres_bin_size_minutes, cat_field)
+        results[cat] = np.column_stack((arr, dep, occ))
 
     # Store main results bydatetime DataFrames
     bydt_dfs = {}
     bydt_highres_dfs = {}
 
     if has_cat_field:
+        # Convert stacked arrays to Dataframes. Result is dict with keys 'agg' and 'res'
+        bydt_dfs_cat = arrays_to_df(results, start_analysis_np, end_analysis_np,
+                                    bin_size_minutes, highres_bin_size_minutes, cat_field)
         cat_key = '_'.join(bydt_dfs_cat['agg'].index.names)
         bydt_dfs[cat_key] = bydt_dfs_cat['agg']
         if keep_highres_bydatetime:
@@ -268,11 +274,7 @@ def make_bydatetime(stops_df: pd.DataFrame, infield: str, outfield: str,
     results_totals = {}
     totals_key = 'datetime'
 
-    total_occ_arr_dep = np.zeros((num_bins, 3), dtype=np.float64)
-    for cat, oad_array in results.items():
-        total_occ_arr_dep += oad_array
-
-    results_totals[totals_key] = total_occ_arr_dep
+    results_totals[totals_key] = np.column_stack((arr_all.sum(axis=0), dep_all.sum(axis=0), occ_all.sum(axis=0)))
     bydt_dfs_total = arrays_to_df(results_totals, start_analysis_np, end_analysis_np,
                                   bin_size_minutes, highres_bin_size_minutes)
     bydt_dfs[totals_key] = bydt_dfs_total['agg']
@@ -283,6 +285,39 @@ def make_bydatetime(stops_df: pd.DataFrame, infield: str, outfield: str,
     return bydt_dfs, bydt_highres_dfs
 
 
+def split_categories(cat_starts, cat_ends, max_pieces, min_piece_size=MIN_STOPS_PER_PIECE):
+    """
+    Split the stop records of each category into contiguous pieces that can be processed in parallel.
+
+    Parameters
+    ----------
+    cat_starts: ndarray of int
+        Index of the first stop record of each category
+    cat_ends: ndarray of int
+        Index one past the last stop record of each category
+    max_pieces: int
+        Maximum number of pieces per category, usually the number of threads
+    min_piece_size: int
+        Categories are only split into pieces of at least this many stop records
+
+    Returns
+    -------
+    Tuple of ndarrays (piece_starts, piece_ends, first_piece). `first_piece` is the index of the
+    first piece of each category.
+    """
+    num_pieces = np.clip((cat_ends - cat_starts) // min_piece_size, 1, max(max_pieces, 1))
+    first_piece = np.concatenate(([0], np.cumsum(num_pieces)[:-1])).astype(np.int64)
+    piece_bounds = [np.linspace(s, e, n + 1).astype(np.int64) for s, e, n in zip(cat_starts, cat_ends, num_pieces)]
+    if piece_bounds:
+        piece_starts = np.concatenate([b[:-1] for b in piece_bounds])
+        piece_ends = np.concatenate([b[1:] for b in piece_bounds])
+    else:
+        piece_starts = np.zeros(0, dtype=np.int64)
+        piece_ends = np.zeros(0, dtype=np.int64)
+
+    return piece_starts, piece_ends, first_piece
+
+
 def check_date_ranges(start_analysis_dt, end_analysis_dt, min_in_date, max_out_date):
     """
 
@@ -319,64 +354,71 @@ def arrays_to_df(results_arrays, start_analysis_dt, end_analysis_dt,
 
     rng_bydt = Series(pd.date_range(start_analysis_dt, end_analysis_dt, freq=Minute(resolution_bin_size_minutes)))
 
-    agg_dfs = []
-    res_dfs = []
-    for cat, ado_array in results_arrays.items():
-        # Create Dataframe from ndarray
-        res_df = pd.DataFrame(ado_array, columns=['arrivals', 'departures', 'occupancy'])
-
-        # Add datetime column and category column (still assuming just one category field)
-        res_df['datetime'] = rng_bydt
-        res_df['date'] = res_df['datetime'].map(lambda x: x.date())
-        res_df['bin_of_day'] = res_df['datetime'].map(lambda x: hmlib.bin_of_day(x, bin_size_minutes))
-
-        # Aggregate by bin_size_minutes if necessary
-
-        if catfield:
-            for c in catfield:
-                res_df[c] = cat
-
-            agg_df = res_df.groupby([catfield[0], 'date', 'bin_of_day']).agg(
-                arrivals=pd.NamedAgg(column='arrivals', aggfunc='sum'),
-                departures=pd.NamedAgg(column='departures', aggfunc='sum'),
-                occupancy=pd.NamedAgg(column='occupancy', aggfunc='mean'))
-        else:
-            agg_df = res_df.groupby(['date', 'bin_of_day']).agg(
-                arrivals=pd.NamedAgg(column='arrivals', aggfunc='sum'),
-                departures=pd.NamedAgg(column='departures', aggfunc='sum'),
-                occupancy=pd.NamedAgg(column='occupancy', aggfunc='mean'))
-
-        agg_df = agg_df.reset_index(drop=False)
-
-        # Compute datetime
-        agg_df['datetime'] = agg_df.apply(
-            lambda x: pd.Timestamp(x.date) + pd.Timedelta(x.bin_of_day * bin_size_minutes, 'm'), axis=1)
-
-        # Add additional fields
-        agg_df['day_of_week'] = agg_df['datetime'].map(lambda x: x.weekday())
-        agg_df['dow_name'] = agg_df['datetime'].map(lambda x: x.strftime('%a'))
-        agg_df['bin_of_day_str'] = agg_df['datetime'].map(lambda x: x.strftime('%H:%M'))
-        agg_df['bin_of_week'] = agg_df['datetime'].map(lambda x: hmlib.bin_of_week(x, bin_size_minutes))
-
-        agg_dfs.append(agg_df)  # Add category specific dataframe to list
-        res_dfs.append(res_df)  # Add category specific dataframe to list
-
-    # Concatenate the dfs in cat_dfs
-    if len(agg_dfs) > 1:
-        agg_bydt_df = pd.concat(agg_dfs)
-        res_bydt_df = pd.concat(res_dfs)
+    # The calendar fields are the same for every category, so compute them once
+    res_cal_df = pd.DataFrame({'datetime': rng_bydt, 'date': rng_bydt.dt.date})
+    res_cal_df['bin_of_day'] = \
+        ((rng_bydt.dt.hour * 60 + rng_bydt.dt.minute) // bin_size_minutes).astype(np.int64)
+
+    # Map each high resolution bin to the bin_size_minutes bin it is aggregated into
+    agg_bin_codes, agg_bins = pd.factorize(rng_bydt.dt.floor(Minute(bin_size_minutes)), sort=True)
+    num_res_bins_per_agg_bin = np.bincount(agg_bin_codes)
+
+    agg_cal_df = pd.DataFrame({'datetime': agg_bins})
+    agg_dt = agg_cal_df['datetime'].dt
+    agg_cal_df['day_of_week'] = agg_dt.weekday.astype(np.int64)
+    agg_cal_df['dow_name'] = agg_dt.strftime('%a')
+    agg_cal_df['bin_of_day_str'] = agg_dt.strftime('%H:%M')
+    agg_cal_df['bin_of_day'] = ((agg_dt.hour * 60 + agg_dt.minute) // bin_size_minutes).astype(np.int64)
+    agg_cal_df['bin_of_week'] = (agg_cal_df['day_of_week'] * 1440 + agg_dt.hour * 60 + agg_dt.minute) // bin_size_minutes
+
+    # Stack the per category arrays so that all categories can be framed in one go
+    keys = list(results_arrays.keys())
+    num_cats = len(keys)
+    num_res_bins = len(res_cal_df)
+    num_agg_bins = len(agg_bins)
+    ado_all = np.stack(list(results_arrays.values()))
+
+    # Every category spans the same calendar, so repeat the calendar rows once per category
+    if num_cats > 1:
+        res_bydt_df = res_cal_df.take(np.tile(np.arange(num_res_bins), num_cats))
     else:
-        agg_bydt_df = agg_dfs[0]
-        res_bydt_df = res_dfs[0]
+        res_bydt_df = res_cal_df.copy()
+    res_bydt_df.insert(0, 'arrivals', ado_all[:, :, 0].ravel())
+    res_bydt_df.insert(1, 'departures', ado_all[:, :, 1].ravel())
+    res_bydt_df.insert(2, 'occupancy', ado_all[:, :, 2].ravel())
+
+    # Add category column to highres df (still assuming just one category field). The agg
+    # df gets its category index level below.
+    if catfield:
+        for c in catfield:
+            res_bydt_df[c] = np.repeat(np.array(keys, dtype=object), num_res_bins)
+
+    # Aggregate by bin_size_minutes - arrivals and departures are summed and occupancy is averaged.
+    # Offsetting the bin codes by category lets a single bincount handle all categories.
+    all_agg_bin_codes = (np.arange(num_cats)[:, None] * num_agg_bins + agg_bin_codes).ravel()
+    num_all_agg_bins = num_cats * num_agg_bins
+    agg_bydt_df = agg_cal_df.take(np.tile(np.arange(num_agg_bins), num_cats))
+    agg_bydt_df.insert(0, 'arrivals', np.bincount(all_agg_bin_codes, weights=ado_all[:, :, 0].ravel(),
+                                                  minlength=num_all_agg_bins))
+    agg_bydt_df.insert(1, 'departures', np.bincount(all_agg_bin_codes, weights=ado_all[:, :, 1].ravel(),
+                                                    minlength=num_all_agg_bins))
+    agg_bydt_df.insert(2, 'occupancy', np.bincount(all_agg_bin_codes, weights=ado_all[:, :, 2].ravel(),
+                                                   minlength=num_all_agg_bins)
+                       / np.tile(num_res_bins_per_agg_bin, num_cats))
 
     # Create multi-index based on datetime and catfield
     if catfield is not None:
-        midx_fields = catfield.copy()
+        # Build the index directly from category codes and datetime bin codes (the categories were
+        # stacked in results_arrays order, each spanning all of agg_bins). Avoids hashing
+        # the category strings again in set_index.
+        cat_codes, cat_level = pd.factorize(pd.Index(keys), sort=True)
+        midx = pd.MultiIndex(levels=[cat_level, agg_bins],
+                             codes=[np.repeat(cat_codes, num_agg_bins),
+                                    np.tile(np.arange(num_agg_bins), num_cats)],
+                             names=catfield + ['datetime'])
+        agg_bydt_df.index = midx
     else:
-        midx_fields = []
-
-    midx_fields.append('datetime')
-    agg_bydt_df.set_index(midx_fields, inplace=True, drop=True)
+        agg_bydt_df.set_index('datetime', inplace=True, drop=True)
     agg_bydt_df.sort_index(inplace=True)
 
     # Reorder the columns
@@ -390,210 +432,121 @@ def arrays_to_df(results_arrays, start_analysis_dt, end_analysis_dt,
     return bydt_dfs
 
 
-def update_occ(occ, entry_bin, rec_type, list_of_inc_arrays):
+@njit(cache=True)
+def accumulate_occ_arr_dep(in_ns, out_ns, occ_weight, start_analysis_ns, bin_size_ns, num_bins, edge_bins,
+                           occ, arr, dep):
     """
-    Increment occupancy array
+    Increment occupancy, arrival and departure arrays in a single pass over the stop records.
+    Compiled with numba.
 
-    Parameters
-    ----------
-    occ
-    entry_bin
-    rec_type
-    list_of_inc_arrays
-
-    Returns
-    -------
-
-    """
-    num_stop_recs = len(entry_bin)
-    for i in range(num_stop_recs):
-        if rec_type[i] in ['inner', 'left', 'right', 'outer']:
-            pos = entry_bin[i]
-            occ_inc = list_of_inc_arrays[i]
-            try:
-                occ[pos:pos + len(occ_inc)] += occ_inc
-            except (IndexError, TypeError) as error:
-                raise LookupError(f'pos {pos} occ_inc {occ_inc}\n{error}')
-
-
-def in_bin_occ_frac(entry_bin: int,
-                    in_dt_np: np.datetime64,
-                    out_dt_np: np.datetime64,
-                    start_analysis_dt_np: np.datetime64,
-                    bin_size_minutes: int,
-                    edge_bins: int = 1):
-    """
-    Computes fractional occupancy in arrival (entry) bin.
+    Entry and exit bins and the fractional occupancy in those bins are computed for each stop
+    on the fly. Stops that arrive (depart) before (after) the start (end) of the analysis range
+    only contribute occupancy to the bins inside the analysis range and are not counted as
+    arrivals (departures). Stops with an exit time before the entry time do not contribute
+    any occupancy.
 
     Parameters
     ----------
-    entry_bin : int
-        bin in which entity arrives
-    in_dt_np : numpy datetime64[s]
-        entry time
-    out_dt_np : numpy datetime64[s]
-        exit time
-    start_analysis_dt_np : numpy datetime64[s]
-        datetime to start computing metrics
-    bin_size_minutes : int
-        bin size in minutes
-    edge_bins : int
-        1=fractional, 2=whole bin
-
-    Returns
-    -------
-    Entry bin fraction in [0.0,1.0]
+    in_ns: ndarray of int64
+        Entry time for each stop as nanoseconds since the epoch
+    out_ns: ndarray of int64
+        Exit time for each stop as nanoseconds since the epoch
+    occ_weight: ndarray of float
+        Occupancy weight for each stop
+    start_analysis_ns: int
+        Start of analysis range as nanoseconds since the epoch
+    bin_size_ns: int
+        Bin size in nanoseconds
+    num_bins: int
+        Total number of time bins in analysis range
+    edge_bins: int
+        Occupancy contribution method for arrival and departure bins. 1=fractional, 2=whole bin
+    occ: ndarray
+        Occupancy by bin, updated in place
+    arr: ndarray of int
+        Arrivals by bin, updated in place
+    dep: ndarray of int
+        Departures by bin, updated in place
 
     """
+    for i in range(len(in_ns)):
+        rel_in_ns = in_ns[i] - start_analysis_ns
+        rel_out_ns = out_ns[i] - start_analysis_ns
+        entry_bin = rel_in_ns // bin_size_ns
+        exit_bin = rel_out_ns // bin_size_ns
+
+        # Arrivals and departures that happen within the analysis range
+        if 0 <= entry_bin < num_bins:
+            arr[entry_bin] += 1
+        if 0 <= exit_bin < num_bins:
+            dep[exit_bin] += 1
+
+        # Backwards stop records contribute no occupancy
+        if rel_out_ns < rel_in_ns:
+            continue
+
+        # Clip to the bins inside the analysis range. The edge fractions are only used
+        # if the entry or exit bin is inside the analysis range.
+        clipped_entry_bin = max(entry_bin, 0)
+        clipped_exit_bin = min(exit_bin, num_bins - 1)
+        if clipped_entry_bin > clipped_exit_bin:
+            continue
+
+        if edge_bins == 1:
+            in_frac = (min(rel_out_ns, (entry_bin + 1) * bin_size_ns) - rel_in_ns) / bin_size_ns
+            out_frac = (rel_out_ns - max(rel_in_ns, exit_bin * bin_size_ns)) / bin_size_ns
+        else:
+            in_frac = 1.0
+            out_frac = 1.0
 
-    if edge_bins == 1:
-        rel_in_time_secs = (in_dt_np - start_analysis_dt_np).astype('timedelta64[s]').astype(np.float64)
-        rel_out_time_secs = (out_dt_np - start_analysis_dt_np).astype('timedelta64[s]').astype(np.float64)
-        rel_right_bin_edge_secs = (entry_bin + 1) * bin_size_minutes * 60
-        rel_right_edge_secs = np.minimum(rel_out_time_secs, rel_right_bin_edge_secs)
-        in_bin_seconds = (rel_right_edge_secs - rel_in_time_secs)
-        inbin_occ_frac = in_bin_seconds / (bin_size_minutes * 60.0)
-    else:
-        # inbin_occ_frac = 1.0
-        inbin_occ_frac = np.ones(in_dt_np.size)
-
-    return inbin_occ_frac
+        for b in range(clipped_entry_bin, clipped_exit_bin + 1):
+            if b == entry_bin:
+                occ[b] += in_frac * occ_weight[i]
+            elif b == exit_bin:
+                occ[b] += out_frac * occ_weight[i]
+            else:
+                occ[b] += occ_weight[i]
 
 
-# This is new and untested.
-def out_bin_occ_frac(exit_bin: int, in_dt_np, out_dt_np, start_analysis_dt_np,
-                     bin_size_minutes: int, edge_bins: int = 1):
+@functools.lru_cache(maxsize=16)
+def accumulate_kernel(bin_size_ns: int):
     """
-    Computes fractional occupancy in departure (exit) bin.
+    Get a function that runs `accumulate_occ_arr_dep` for each piece of stop records, specialized for a fixed bin size.
+
+    The bin size is a compile time constant in the returned function, which lets the compiler
+    replace the integer divisions by the bin size with cheaper multiply and shift operations.
+    The pieces, as made by `split_categories`, write to disjoint rows of the output arrays and are
+    processed in parallel. The rows of a category that was split into several pieces are summed
+    afterwards.
 
     Parameters
     ----------
-    exit_bin : int
-        bin in which entity arrives
-    in_dt_np : numpy datetime64[s]
-        entry time
-    out_dt_np : numpy datetime64[s]
-        exit time
-    start_analysis_dt_np : numpy datetime64[s]
-        datetime to start computing metrics
-    bin_size_minutes : int
-        bin size in minutes
-    edge_bins : int
-        1=fractional, 2=whole bin
+    bin_size_ns: int
+        Bin size in nanoseconds
 
     Returns
     -------
-    Exit bin fraction in [0.0,1.0]
-
+    Numba compiled function with arguments `in_ns`, `out_ns`, `occ_weight`, `start_analysis_ns` (as for
+    `accumulate_occ_arr_dep`), `piece_starts` and `piece_ends` (start and end index of the records of each
+    piece), `num_bins`, `edge_bins` and `occ`, `arr` and `dep` (occupancy, arrivals and departures arrays of
+    shape (num pieces, num_bins), updated in place)
+
+    Notes
+    -----
+    Categories with at least 2 * `MIN_STOPS_PER_PIECE` stop records are split into up to
+    `get_num_threads()` pieces. Summing the pieces changes the order in which the floating point
+    occupancy is added up, so the occupancy of such categories can differ in the last bits between
+    machines with different numbers of threads. Arrivals and departures are integer counts and are exact.
     """
 
-    if edge_bins == 1:
-        rel_in_time_secs = (in_dt_np - start_analysis_dt_np).astype('timedelta64[s]').astype(np.float64)
-        rel_out_time_secs = (out_dt_np - start_analysis_dt_np).astype('timedelta64[s]').astype(np.float64)
-        rel_left_bin_edge_secs = exit_bin * bin_size_minutes * 60
-        rel_left_edge_secs = np.maximum(rel_in_time_secs, rel_left_bin_edge_secs)
-        out_bin_seconds = (rel_out_time_secs - rel_left_edge_secs)
-        outbin_occ_frac = out_bin_seconds / (bin_size_minutes * 60.0)
-    else:
-        # outbin_occ_frac = 1.0
-        outbin_occ_frac = np.ones(in_dt_np.size)
-
-    return outbin_occ_frac
-
-
-def make_occ_inc(in_bin: int, out_bin: int,
-                 in_frac: float, out_frac: float, occ_weight: float):
-    """Create array of occupancy increments for a single stop
-
-    Parameters
-    ----------
-    in_bin: int
-    out_bin: int
-    in_frac: float
-    out_frac: float
-    occ_weight: float
-
-    """
-    n_bins = out_bin - in_bin + 1
-    if n_bins > 2:
-        # [in_frac, occ_weight, occ_weight, ..., out_frac]
-        ones = np.ones(n_bins - 2, dtype=np.float64) * occ_weight
-        occ_inc = np.concatenate((np.array([in_frac]) * occ_weight, ones, np.array([out_frac]) * occ_weight))
-    elif n_bins == 2:
-        # [in_frac, out_frac]
-        occ_inc = np.concatenate((np.array([in_frac]) * occ_weight, np.array([out_frac]) * occ_weight))
-    else:
-        # [in_frac]
-        occ_inc = np.array([in_frac]) * occ_weight
-
-    return occ_inc
-
-
-def update_occ_incs(in_bins, out_bins, list_of_inc_arrays, rec_types, num_bins):
-    """
-    Update the in_bin, out_bin, and occupancy incrementer array for each
-    stop record based on the record type.
-
-    Stops that fall entirely within the analysis range (type='inner') are unchanged.
-    Stops that arrive (depart) before (after) the start (end) of the analysis range
-    are updated to reflect this.
-
-    Parameters
-    ----------
-    in_bins: List[int]
-        Entry bin for each stop
-    out_bins: List[int]
-        Exit bin for each stop
-    list_of_inc_arrays: List[ndarray]
-        Occupancy incrementer array for each stop
-    rec_types: List[str]
-        Record type for each stop
-    num_bins: int
-        Total number of time bins in analysis range
-
-    """
-    num_stop_recs = len(in_bins)
-    rectype_counts = {}
-
-    for i in range(num_stop_recs):
-        if rec_types[i] == 'inner':
-            rectype_counts['inner'] = rectype_counts.get('inner', 0) + 1
-        elif rec_types[i] == 'left':
-            # arrival is outside analysis window (in_bin < 0)
-            rectype_counts['left'] = rectype_counts.get('left', 0) + 1
-            new_in_bin = 0
-            bin_shift = -1 * in_bins[i]
-            new_inc_array = list_of_inc_arrays[i][bin_shift:]
-            # Update main arrays
-            in_bins[i] = new_in_bin
-            list_of_inc_arrays[i] = new_inc_array
-        elif rec_types[i] == 'right':
-            # departure is outside analysis window (out_bin >= num_bins)
-            rectype_counts['right'] = rectype_counts.get('right', 0) + 1
-            new_out_bin = num_bins - 1
-            bin_shift = out_bins[i] - (num_bins - 1)
-            # Keep all but the last bin_shift elements
-            new_inc_array = list_of_inc_arrays[i][:-bin_shift]
-            # Update main arrays
-            out_bins[i] = new_out_bin
-            list_of_inc_arrays[i] = new_inc_array
-        elif rec_types[i] == 'outer':
-            # This is combo of left and right
-            rectype_counts['outer'] = rectype_counts.get('outer', 0) + 1
-            new_in_bin = 0
-            new_out_bin = num_bins - 1
-            entry_bin_shift = -1 * in_bins[i]
-            exit_bin_shift = out_bins[i] - (num_bins - 1)
-            new_inc_array = list_of_inc_arrays[i][entry_bin_shift:-exit_bin_shift]
-            # Update main arrays
-            in_bins[i] = new_in_bin
-            out_bins[i] = new_out_bin
-            list_of_inc_arrays[i] = new_inc_array
-        elif rec_types[i] == 'backwards':
-            rectype_counts['backwards'] = rectype_counts.get('backwards', 0) + 1
-        elif rec_types[i] == 'none':
-            rectype_counts['none'] = rectype_counts.get('none', 0) + 1
-        else:
-            rectype_counts['unknown'] = rectype_counts.get('unknown', 0) + 1
-
-    return rectype_counts
+    @njit(parallel=True, cache=True)
+    def accumulate(in_ns, out_ns, occ_weight, start_analysis_ns, piece_starts, piece_ends, num_bins, edge_bins,
+                   occ, arr, dep):
+        for j in prange(len(piece_starts)):
+            s = piece_starts[j]
+            e = piece_ends[j]
+            accumulate_occ_arr_dep(in_ns[s:e], out_ns[s:e], occ_weight[s:e], start_analysis_ns, bin_size_ns,
+                                   num_bins, edge_bins,
+                                   occ[j], arr[j], dep[j])
+
+    return accumulate
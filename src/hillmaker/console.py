@@ -117,6 +117,11 @@ def process_command_line(argv=None):
         help="Destination path for exported csv files, default is current directory."
     )
 
+    optional.add_argument(
+        '--export_format', type=str, default='csv', choices=['csv', 'parquet', 'both'],
+        help="File format for exported DataFrames, default is csv. Parquet requires pyarrow or fastparquet."
+    )
+
     # Plot export options
     optional.add_argument(
         '--no_dow_plots', action='store_true',
@@ -2,8 +2,12 @@
 
 # Copyright 2022-2023 Mark Isken, Jacob Norman
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import logging
+import os
+
+import pandas as pd
 
 try:
     import tomllib
@@ -15,6 +19,9 @@ from hillmaker.summarize import summarize, summarize_los
 from hillmaker.hmlib import HillTimer
 from hillmaker.plotting import make_plots
 
+# Number of decimal places kept for floats in exported csv files
+CSV_FLOAT_DECIMALS = 6
+
 
 def setup_logger(verbosity: int):
     # Set logging level
@@ -60,9 +67,20 @@ def compute_hills_stats(scenario):
     # This should inherit level from root logger
     logger = logging.getLogger(__name__)
 
+    # Drop the stops of excluded categories up front and give make_bydatetime a categorical
+    # category column, so the category values only need to be hashed once
+    stops_df = scenario.stops_preprocessed_df
+    cat_field = scenario.cat_field
+    if cat_field is not None:
+        if scenario.cats_to_exclude:
+            stops_df = stops_df.loc[~stops_df[cat_field].isin(scenario.cats_to_exclude)]
+        if not isinstance(stops_df[cat_field].dtype, pd.CategoricalDtype):
+            stops_df = stops_df.copy(deep=False)
+            stops_df[cat_field] = stops_df[cat_field].astype('category')
+
     # Create the bydatetime DataFrame
     with HillTimer() as t:
-        bydt_dfs, bydt_highres_dfs = make_bydatetime(scenario.stops_preprocessed_df,
+        bydt_dfs, bydt_highres_dfs = make_bydatetime(stops_df,
                                                      scenario.in_field,
                                                      scenario.out_field,
                                                      scenario.start_analysis_dt,
@@ -75,7 +93,7 @@ def compute_hills_stats(scenario):
                                                      occ_weight_field=scenario.occ_weight_field,
                                                      edge_bins=scenario.edge_bins)
 
-    logger.debug(f"Datetime matrix created (seconds): {t.interval:.4f}")
+    logger.debug("Datetime matrix created (seconds): %.4f", t.interval)
 
     # Create the summary stats DataFrames
     summary_dfs = {}
@@ -87,7 +105,7 @@ def compute_hills_stats(scenario):
                                     percentiles=scenario.percentiles,
                                     verbosity=scenario.verbosity)
 
-        logger.debug(f"Summaries by datetime created (seconds): {t.interval:.4f}")
+        logger.debug("Summaries by datetime created (seconds): %.4f", t.interval)
 
     # Compute los summary
     with HillTimer() as t:
@@ -95,7 +113,7 @@ def compute_hills_stats(scenario):
                                     scenario.los_field_name,
                                     cat_field=scenario.cat_field)
 
-    logger.debug(f"Length of stay summary created (seconds): {t.interval:.4f}")
+    logger.debug("Length of stay summary created (seconds): %.4f", t.interval)
 
     # Gather results
     hills = {'bydatetime': bydt_dfs, 'summaries': summary_dfs, 'los_summary': los_summary,
@@ -103,7 +121,7 @@ def compute_hills_stats(scenario):
                           'in_field': scenario.in_field,
                           'out_field': scenario.out_field,
                           'start_analysis_dt': scenario.start_analysis_dt,
-                          'end_analysis_dt': scenario.start_analysis_dt,
+                          'end_analysis_dt': scenario.end_analysis_dt,
                           'cat_field': scenario.cat_field,
                           'occ_weight_field': scenario.occ_weight_field,
                           'bin_size_minutes': scenario.bin_size_minutes,
@@ -145,26 +163,33 @@ def _make_hills(scenario):
     # Compute stats
     with HillTimer() as t:
         starttime = t.start
-        logger.info(f"Starting scenario {scenario.scenario_name}")
+        logger.info("Starting scenario %s", scenario.scenario_name)
         hills = compute_hills_stats(scenario)
 
-    logger.info(f"bydatetime and summaries by datetime created (seconds): {t.interval:.4f}")
+    logger.info("bydatetime and summaries by datetime created (seconds): %.4f", t.interval)
 
-    # Export results to csv if requested
+    # Export results to csv and/or parquet if requested
+    export_format = scenario.export_format.value
+    export_format_str = 'csv and parquet' if export_format == 'both' else export_format
     if scenario.export_bydatetime_csv:
         with HillTimer() as t:
-            export_bydatetime(hills['bydatetime'], scenario.scenario_name, scenario.csv_export_path)
+            export_bydatetime(hills['bydatetime'], scenario.scenario_name, scenario.csv_export_path,
+                              export_format)
 
-        logger.info(f"By datetime exported to csv in {scenario.csv_export_path} (seconds): {t.interval:.4f}")
+        logger.info("By datetime exported to %s in %s (seconds): %.4f", export_format_str, scenario.csv_export_path,
+                    t.interval)
 
     if scenario.export_summaries_csv:
         with HillTimer() as t:
             if scenario.nonstationary_stats:
-                export_summaries(hills['summaries'], scenario.scenario_name, scenario.csv_export_path, 'nonstationary')
+                export_summaries(hills['summaries'], scenario.scenario_name, scenario.csv_export_path, 'nonstationary',
+                                 export_format)
             if scenario.stationary_stats:
-                export_summaries(hills['summaries'], scenario.scenario_name, scenario.csv_export_path, 'stationary')
+                export_summaries(hills['summaries'], scenario.scenario_name, scenario.csv_export_path, 'stationary',
+                                 export_format)
 
-        logger.info(f"Summaries exported to csv in {scenario.csv_export_path} (seconds): {t.interval:.4f}")
+        logger.info("Summaries exported to %s in %s (seconds): %.4f", export_format_str, scenario.csv_export_path,
+                    t.interval)
 
     # Plots
     if scenario.make_all_week_plots or scenario.make_all_dow_plots or \
@@ -178,8 +203,8 @@ def _make_hills(scenario):
     runtime = endtime - starttime
     hills['runtime'] = runtime
 
-    logger.info(f"Total time (seconds): {endtime - starttime:.4f}")
-    logger.debug(f"Scenario {scenario.scenario_name} complete at {endtime}\n")
+    logger.info("Total time (seconds): %.4f", endtime - starttime)
+    logger.debug("Scenario %s complete at %s\n", scenario.scenario_name, endtime)
 
     return hills
 
@@ -362,9 +387,9 @@ def get_los_stats(hills: dict, by_category: bool = True):
     return stats
 
 
-def export_bydatetime(bydt_dfs, scenario_name, export_path):
+def export_bydatetime(bydt_dfs, scenario_name, export_path, export_format='csv'):
     """
-    Export bydatetime DataFrames to csv files.
+    Export bydatetime DataFrames to csv and/or parquet files.
 
 
     Parameters
@@ -376,23 +401,38 @@ def export_bydatetime(bydt_dfs, scenario_name, export_path):
         Used in output filenames
 
     export_path: str or Path
-        Destination path for exported csv files
+        Destination path for exported files
+
+    export_format: str
+        'csv', 'parquet' or 'both'. Default is 'csv'.
     """
 
+    Path(export_path).mkdir(parents=True, exist_ok=True)
+    export_dir = os.fspath(export_path)
+
+    dt_cols = ['arrivals', 'departures', 'occupancy',
+               'dow_name', 'bin_of_day_str', 'day_of_week', 'bin_of_day', 'bin_of_week']
+
+    export_jobs = []
     for d in bydt_dfs:
-        file_bydt_csv = f'{scenario_name}_bydatetime_{d}.csv'
-        Path(export_path).mkdir(parents=True, exist_ok=True)
-        csv_wpath = Path(export_path, file_bydt_csv)
+        # Nothing to write for an empty DataFrame
+        if bydt_dfs[d].empty:
+            continue
 
-        dt_cols = ['arrivals', 'departures', 'occupancy',
-                   'dow_name', 'bin_of_day_str', 'day_of_week', 'bin_of_day', 'bin_of_week']
+        file_bydt_stem = f'{scenario_name}_bydatetime_{d}'
+        if export_format in ('csv', 'both'):
+            csv_wpath = os.path.join(export_dir, f'{file_bydt_stem}.csv')
+            export_jobs.append((_write_csv, bydt_dfs[d], csv_wpath, dict(columns=dt_cols, index=True)))
+        if export_format in ('parquet', 'both'):
+            parquet_wpath = os.path.join(export_dir, f'{file_bydt_stem}.parquet')
+            export_jobs.append((_write_parquet, bydt_dfs[d], parquet_wpath, dict(columns=dt_cols, index=True)))
 
-        bydt_dfs[d].to_csv(csv_wpath, index=True, float_format='%.6f', columns=dt_cols)
+    _write_exports(export_jobs)
 
 
-def export_summaries(summary_all_dfs, scenario_name, export_path, temporal_key):
+def export_summaries(summary_all_dfs, scenario_name, export_path, temporal_key, export_format='csv'):
     """
-    Export occupancy, arrival, and departure summary DataFrames to csv files.
+    Export occupancy, arrival, and departure summary DataFrames to csv and/or parquet files.
 
 
     Parameters
@@ -404,27 +444,76 @@ def export_summaries(summary_all_dfs, scenario_name, export_path, temporal_key):
         Used in output filenames
 
     export_path: str
-        Destination path for exported csv files
+        Destination path for exported files
 
     temporal_key: str
         'nonstationary' or 'stationary'
 
+    export_format: str
+        'csv', 'parquet' or 'both'. Default is 'csv'.
+
     """
 
+    Path(export_path).mkdir(parents=True, exist_ok=True)
+    export_dir = os.fspath(export_path)
+
+    export_jobs = []
     summary_dfs = summary_all_dfs[temporal_key]
     for d in summary_dfs:
         df_dict = summary_dfs[d]
         for metric in ['occupancy', 'arrivals', 'departures']:
 
             df = df_dict[metric]
-            file_summary_csv_stem = f'{scenario_name}_{metric}'
+            if df.empty:
+                continue
+
+            file_summary_stem = f'{scenario_name}_{metric}'
             if len(d) > 0:
-                file_summary_csv = f'{file_summary_csv_stem}_{d}.csv'
-            else:
-                # Stationary overall
-                file_summary_csv = f'{file_summary_csv_stem}.csv'
+                file_summary_stem = f'{file_summary_stem}_{d}'
+
+            if export_format in ('csv', 'both'):
+                csv_wpath = os.path.join(export_dir, f'{file_summary_stem}.csv')
+                export_jobs.append((_write_csv, df, csv_wpath, dict(index=False)))
+            if export_format in ('parquet', 'both'):
+                parquet_wpath = os.path.join(export_dir, f'{file_summary_stem}.parquet')
+                export_jobs.append((_write_parquet, df, parquet_wpath, dict(index=False)))
+
+    _write_exports(export_jobs)
+
+
+def _write_exports(export_jobs):
+    """
+    Write DataFrames to files concurrently.
+
+    Parameters
+    ----------
+    export_jobs: list of tuples
+        Each tuple is (writer function such as `_write_csv`, DataFrame, destination path,
+        dict of keyword arguments for the writer)
+    """
+
+    with ThreadPoolExecutor() as executor:
+        futures = [executor.submit(writer, df, wpath, **kwargs) for writer, df, wpath, kwargs in export_jobs]
+
+    # Raise any exception from the writes
+    for future in futures:
+        future.result()
+
+
+def _write_csv(df, csv_wpath, columns=None, index=True):
+    """
+    Write DataFrame to csv file with floats rounded to `CSV_FLOAT_DECIMALS` decimal places.
+
+    The rounding copy is made here, when the file is written, so that only the frames currently
+    being written have a temporary copy. Rounding is vectorized and much cheaper than formatting
+    every float with `float_format`. The column selection is left to `to_csv` rather than taking
+    a subset first, which would copy the (object) columns once more before rounding.
+    """
+    df.round(CSV_FLOAT_DECIMALS).to_csv(csv_wpath, columns=columns, index=index)
 
-            Path(export_path).mkdir(parents=True, exist_ok=True)
-            csv_wpath = Path(export_path, file_summary_csv)
 
-            df.to_csv(csv_wpath, index=False, float_format='%.6f')
+def _write_parquet(df, parquet_wpath, columns=None, index=True):
+    """Write DataFrame, optionally only the given columns, to parquet file."""
+    if columns is not None:
+        df = df[columns]
+    df.to_parquet(parquet_wpath, index=index)
@@ -15,6 +15,16 @@ import numpy as np
 import pandas as pd
 from pandas import Timestamp
 
+# Integer codes for the relationship of a stop record to the analysis date range.
+# See `stoprec_relationship_type` for the meaning of each type.
+RECTYPE_NONE = 0
+RECTYPE_INNER = 1
+RECTYPE_LEFT = 2
+RECTYPE_RIGHT = 3
+RECTYPE_OUTER = 4
+RECTYPE_BACKWARDS = 5
+RECTYPE_NAMES = ('none', 'inner', 'left', 'right', 'outer', 'backwards')
+
 
 def bin_of_day(dt: Timestamp | np.datetime64, bin_size_mins: int = 60):
     """
@@ -151,6 +161,46 @@ def stoprec_relationship_type(in_dt: Union[Timestamp, np.datetime64],
         return 'none'
 
 
+def stoprec_relationship_codes(in_dt_np: np.ndarray,
+                               out_dt_np: np.ndarray,
+                               start_analysis_dt_np: np.datetime64,
+                               end_analysis_dt_np: np.datetime64):
+    """
+    Vectorized version of `stoprec_relationship_type` returning integer codes.
+
+    Parameters
+    ----------
+    in_dt_np : ndarray of numpy `datetime64` or int64 nanoseconds since the epoch
+        arrival datetimes
+    out_dt_np : ndarray of numpy `datetime64` or int64 nanoseconds since the epoch
+        departure datetimes
+    start_analysis_dt_np : numpy `datetime64` or int64, same representation as `in_dt_np`
+        beginning of analysis period
+    end_analysis_dt_np : numpy `datetime64` or int64, same representation as `in_dt_np`
+        end of analysis period
+
+    Returns
+    -------
+    ndarray of int8 codes, one of the `RECTYPE_*` constants, for each stop record.
+    `RECTYPE_NAMES[code]` gives the type name returned by `stoprec_relationship_type`.
+    """
+
+    in_before = in_dt_np < start_analysis_dt_np
+    in_during = ~in_before & (in_dt_np < end_analysis_dt_np)
+    out_during = (out_dt_np >= start_analysis_dt_np) & (out_dt_np < end_analysis_dt_np)
+    out_after = out_dt_np >= end_analysis_dt_np
+
+    # Conditions are evaluated in order, first match wins
+    conditions = [in_dt_np > out_dt_np,
+                  in_during & out_during,
+                  in_during & out_after,
+                  in_before & out_during,
+                  in_before & out_after]
+    choices = [RECTYPE_BACKWARDS, RECTYPE_INNER, RECTYPE_RIGHT, RECTYPE_LEFT, RECTYPE_OUTER]
+
+    return np.select(conditions, choices, default=RECTYPE_NONE).astype(np.int8)
+
+
 def bin_of_analysis_range(dt_np: np.datetime64,
                           start_analysis_dt_np: np.datetime64,
                           bin_size_mins: int = 60):
@@ -180,11 +230,10 @@ def bin_of_analysis_range(dt_np: np.datetime64,
 
     """
 
-    # Number of minutes from beginning of span
-    minutes = (dt_np - start_analysis_dt_np).astype('timedelta64[s]') / 60.0
-    minutes = minutes.astype(np.int64)
-    # Convert minutes to bin
-    time_bin = np.floor(minutes / bin_size_mins).astype(np.int64)
+    # Nanoseconds from beginning of span
+    rel_ns = (dt_np - start_analysis_dt_np).astype('timedelta64[ns]').astype(np.int64)
+    # Convert to bin with integer floor division so no float round trip is needed
+    time_bin = rel_ns // (bin_size_mins * 60 * 10 ** 9)
 
     return time_bin
 
@@ -193,11 +242,11 @@ class HillTimer:
     """Timing hillmaker components"""
 
     def __enter__(self):
-        self.start = time.process_time()
+        self.start = time.perf_counter()
         return self
 
     def __exit__(self, *args):
-        self.end = time.process_time()
+        self.end = time.perf_counter()
         self.interval = self.end - self.start
 
 
@@ -16,6 +16,9 @@ from cycler import cycler
 # from hillmaker.scenario import Scenario
 from hillmaker.hmlib import HillTimer, pctile_field_name
 
+# This should inherit level from root logger
+logger = logging.getLogger(__name__)
+
 # if typing.TYPE_CHECKING:
 #     from hillmaker.scenario import Scenario
 
@@ -88,86 +91,74 @@ def make_plots(scenario, hills: dict):
     dict of matplotlib plot objects
 
     """
-    # Logging
-    # This should inherit level from root logger
-    logger = logging.getLogger(__name__)
+    # Overall day of week by bin of day summaries, shared by the full week and day of week plots
+    dow_binofday_dfs = hills['summaries']['nonstationary']['dow_binofday']
+
+    # Plot settings common to every plot, looked up once instead of per plot
+    scenario_name = scenario.scenario_name
+    plot_kwargs = dict(scenario_name=scenario_name,
+                       bin_size_minutes=scenario.bin_size_minutes,
+                       cap=scenario.cap,
+                       cap_color=scenario.cap_color,
+                       plot_style=scenario.plot_style,
+                       figsize=scenario.figsize,
+                       bar_color_mean=scenario.bar_color_mean,
+                       plot_percentiles=scenario.plot_percentiles,
+                       pctile_color=scenario.pctile_color,
+                       pctile_linestyle=scenario.pctile_linestyle,
+                       pctile_linewidth=scenario.pctile_linewidth,
+                       main_title=scenario.main_title,
+                       main_title_properties=scenario.main_title_properties,
+                       subtitle=scenario.subtitle,
+                       subtitle_properties=scenario.subtitle_properties,
+                       legend_properties=scenario.legend_properties,
+                       xlabel=scenario.xlabel,
+                       ylabel=scenario.ylabel)
 
     # Create and export full week plots if requested
     plots = {}
     if scenario.make_all_week_plots or scenario.export_all_week_plots:
+        if scenario.export_all_week_plots:
+            plot_export_path = scenario.plot_export_path
+        else:
+            plot_export_path = None
+        first_dow = scenario.first_dow
+
         with HillTimer() as t:
-            for metric in hills['summaries']['nonstationary']['dow_binofday']:
-                fullwk_df = hills['summaries']['nonstationary']['dow_binofday'][metric]
+            for metric, fullwk_df in dow_binofday_dfs.items():
 
                 week_range_str = 'week'
-                plot_key = f'{scenario.scenario_name}_{metric}_plot_{week_range_str}'
-
-                if scenario.export_all_week_plots:
-                    plot_export_path = scenario.plot_export_path
-                else:
-                    plot_export_path = None
-
-                plot = make_week_hill_plot(fullwk_df, scenario_name=scenario.scenario_name, metric=metric,
-                                           bin_size_minutes=scenario.bin_size_minutes,
-                                           cap=scenario.cap, cap_color=scenario.cap_color,
-                                           plot_style=scenario.plot_style,
-                                           figsize=scenario.figsize,
-                                           bar_color_mean=scenario.bar_color_mean,
-                                           plot_percentiles=scenario.plot_percentiles,
-                                           pctile_color=scenario.pctile_color,
-                                           pctile_linestyle=scenario.pctile_linestyle,
-                                           pctile_linewidth=scenario.pctile_linewidth,
-                                           main_title=scenario.main_title,
-                                           main_title_properties=scenario.main_title_properties,
-                                           subtitle=scenario.subtitle,
-                                           subtitle_properties=scenario.subtitle_properties,
-                                           legend_properties=scenario.legend_properties,
-                                           xlabel=scenario.xlabel,
-                                           ylabel=scenario.ylabel,
-                                           first_dow=scenario.first_dow,
-                                           plot_export_path=plot_export_path)
+                plot_key = f'{scenario_name}_{metric}_plot_{week_range_str}'
+
+                plot = make_week_hill_plot(fullwk_df, metric=metric, first_dow=first_dow,
+                                           plot_export_path=plot_export_path, **plot_kwargs)
 
                 plots[plot_key] = plot
 
-        logger.info(f"Full week plots created (seconds): {t.interval:.4f}")
+        logger.info("Full week plots created (seconds): %.4f", t.interval)
 
     # Create and export individual day of week plots if requested
     if scenario.make_all_dow_plots or scenario.export_all_dow_plots:
+        if scenario.export_all_dow_plots:
+            plot_export_path = scenario.plot_export_path
+        else:
+            plot_export_path = None
+
+        # The plots are made sequentially, not in a process pool: forked workers can hang at exit
+        # after numba's TBB layer has run make_bydatetime, and spawned workers would need every
+        # calling script to have an ``if __name__ == '__main__'`` guard.
         with HillTimer() as t:
-            for metric in hills['summaries']['nonstationary']['dow_binofday']:
-                fullwk_df = hills['summaries']['nonstationary']['dow_binofday'][metric]
-                for dow in fullwk_df['dow_name'].unique():
-                    dow_df = fullwk_df.loc[fullwk_df['dow_name'] == dow]
+            for metric, fullwk_df in dow_binofday_dfs.items():
+                # Split by day of week in one pass, in order of first appearance
+                for dow, dow_df in fullwk_df.groupby('dow_name', sort=False):
                     week_range_str = dow
-                    plot_key = f'{scenario.scenario_name}_{metric}_plot_{week_range_str}'
-
-                    if scenario.export_all_dow_plots:
-                        plot_export_path = scenario.plot_export_path
-                    else:
-                        plot_export_path = None
-                    plot = make_daily_hill_plot(dow_df, dow.lower(), scenario_name=scenario.scenario_name,
-                                                metric=metric,
-                                                bin_size_minutes=scenario.bin_size_minutes,
-                                                cap=scenario.cap,
-                                                cap_color=scenario.cap_color,
-                                                plot_style=scenario.plot_style,
-                                                figsize=scenario.figsize,
-                                                bar_color_mean=scenario.bar_color_mean,
-                                                plot_percentiles=scenario.plot_percentiles,
-                                                pctile_color=scenario.pctile_color,
-                                                pctile_linestyle=scenario.pctile_linestyle,
-                                                pctile_linewidth=scenario.pctile_linewidth,
-                                                main_title=scenario.main_title,
-                                                main_title_properties=scenario.main_title_properties,
-                                                subtitle=scenario.subtitle,
-                                                subtitle_properties=scenario.subtitle_properties,
-                                                legend_properties=scenario.legend_properties,
-                                                xlabel=scenario.xlabel,
-                                                ylabel=scenario.ylabel,
-                                                plot_export_path=plot_export_path)
+                    plot_key = f'{scenario_name}_{metric}_plot_{week_range_str}'
+
+                    plot = make_daily_hill_plot(dow_df, dow.lower(), metric=metric,
+                                                plot_export_path=plot_export_path, **plot_kwargs)
                     plots[plot_key] = plot
 
-        logger.info(f"Individual day of week plots created (seconds): {t.interval:.4f}")
+        logger.info("Individual day of week plots created (seconds): %.4f", t.interval)
 
     return plots
 
@@ -354,10 +345,10 @@ def make_week_hill_plot(summary_df: pd.DataFrame, metric: str = 'occupancy',
             week_range_str = 'week'
             plot_png = f'{scenario_name}_{metric}_{week_range_str}.png'
             png_wpath = Path(plot_export_path, plot_png)
-            plt.savefig(png_wpath, bbox_inches='tight')
+            fig1.savefig(png_wpath, bbox_inches='tight')
 
         # Suppress plot output in notebook
-        plt.close()
+        plt.close(fig1)
 
     return fig1
 
@@ -547,10 +538,10 @@ def make_week_combo_plot(summary_df1: pd.DataFrame,
             week_range_str = 'week'
             plot_png = f'{scenario_name}_{metric1}_{metric2}_{week_range_str}.png'
             png_wpath = Path(plot_export_path, plot_png)
-            plt.savefig(png_wpath, bbox_inches='tight')
+            fig1.savefig(png_wpath, bbox_inches='tight')
 
         # Suppress plot output in notebook
-        plt.close()
+        plt.close(fig1)
 
     return fig1
 
@@ -733,10 +724,10 @@ def make_daily_hill_plot(summary_df: pd.DataFrame, day_of_week: str, metric: str
             week_range_str = day_of_week
             plot_png = f'{scenario_name}_{metric}_{week_range_str}.png'
             png_wpath = Path(plot_export_path, plot_png)
-            plt.savefig(png_wpath, bbox_inches='tight')
+            fig1.savefig(png_wpath, bbox_inches='tight')
 
         # Suppress plot output in notebook
-        plt.close()
+        plt.close(fig1)
 
     return fig1
 
@@ -924,9 +915,9 @@ def make_daily_combo_plot(summary_df1: pd.DataFrame,
             week_range_str = day_of_week
             plot_png = f'{scenario_name}_{metric1}_{metric2}_{week_range_str}.png'
             png_wpath = Path(export_path, plot_png)
-            plt.savefig(png_wpath, bbox_inches='tight')
+            fig1.savefig(png_wpath, bbox_inches='tight')
 
         # Suppress plot output in notebook
-        plt.close()
+        plt.close(fig1)
 
     return fig1
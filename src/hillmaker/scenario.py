@@ -8,7 +8,7 @@ from datetime import datetime, date
 from pathlib import Path
 import logging
 from typing import List, Tuple, Dict, Optional
-from enum import IntEnum
+from enum import Enum, IntEnum
 from argparse import Namespace
 
 import pandas as pd
@@ -41,6 +41,12 @@ class VerbosityEnum(IntEnum):
     DEBUG = 2
 
 
+class ExportFormatEnum(str, Enum):
+    CSV = 'csv'
+    PARQUET = 'parquet'
+    BOTH = 'both'
+
+
 class Scenario(BaseModel):
     """pydantic model for creating scenario objects from input parameters
 
@@ -83,6 +89,9 @@ class Scenario(BaseModel):
        If True, summary DataFrames are exported to csv files. Default is False.
     csv_export_path : str or Path, optional
         Destination path for exported csv and png files, default is current directory
+    export_format : str, optional
+        File format for exported DataFrames, one of 'csv', 'parquet' or 'both'. Default is 'csv'.
+        Parquet export requires pyarrow (``pip install hillmaker[parquet]``) or fastparquet to be installed.
 
     make_all_dow_plots : bool, optional
        If True, day of week plots are created for occupancy, arrivals, and departures. Default is False.
@@ -266,6 +275,7 @@ class Scenario(BaseModel):
     export_bydatetime_csv: bool = False
     export_summaries_csv: bool = False
     csv_export_path: Path | str | None = Path('.')
+    export_format: ExportFormatEnum = ExportFormatEnum.CSV
 
     make_all_dow_plots: bool = False
     make_all_week_plots: bool = True
@@ -801,7 +811,8 @@ class Scenario(BaseModel):
         scenario_str = f'{scenario_str}Dataframe export options\n{25*"-"}\n'
         scenario_str = f'{scenario_str}export_bydatetime_csv = {self.export_bydatetime_csv}\n'
         scenario_str = f'{scenario_str}export_summaries_csv = {self.export_summaries_csv}\n'
-        scenario_str = f'{scenario_str}csv_export_path = {self.csv_export_path}\n\n'
+        scenario_str = f'{scenario_str}csv_export_path = {self.csv_export_path}\n'
+        scenario_str = f'{scenario_str}export_format = {self.export_format.value}\n\n'
 
         scenario_str = f'{scenario_str}Macro-level plot options\n{25*"-"}\n'
         scenario_str = f'{scenario_str}make_all_dow_plots = {self.make_all_dow_plots}\n'
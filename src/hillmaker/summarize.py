@@ -137,34 +137,47 @@ def summarize_nonstationary(bydt_df: pd.DataFrame, catfield: str | List[str] = N
     if catfield is not None:
         if isinstance(catfield, str):
             catfield = [catfield]
-        if not catfield:
-            bydt_dfgrp = bydt_df.groupby(['day_of_week', 'dow_name', 'bin_of_day', 'bin_of_day_str'])
-        else:
-            bydt_dfgrp = bydt_df.groupby([*catfield, 'day_of_week', 'dow_name', 'bin_of_day', 'bin_of_day_str'])
+        cat_keys = catfield
     else:
-        bydt_dfgrp = bydt_df.groupby(['day_of_week', 'dow_name', 'bin_of_day', 'bin_of_day_str'])
+        cat_keys = []
+
+    # Group on the integer day of week and bin of day fields computed by make_bydatetime. The
+    # dow_name and bin_of_day_str labels are determined by them and are added to the summaries
+    # afterwards, which avoids hashing two string columns of every bydatetime row.
+    bydt_dfgrp = bydt_df.groupby([*cat_keys, 'day_of_week', 'bin_of_day'])
 
-    if verbosity > 1:
-        print(bydt_df.head())
+    if verbosity > 1 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug('bydatetime:\n%s', bydt_df.head())
 
-    occ_stats = bydt_dfgrp['occupancy'].apply(summary_stats, percentiles)
-    arr_stats = bydt_dfgrp['arrivals'].apply(summary_stats, percentiles)
-    dep_stats = bydt_dfgrp['departures'].apply(summary_stats, percentiles)
+    metric_stats = grouped_summary_stats(bydt_dfgrp, ['occupancy', 'arrivals', 'departures'], percentiles)
 
-    if verbosity > 1:
-        print(occ_stats.head())
+    dow_names = bydt_df.drop_duplicates('day_of_week').set_index('day_of_week')['dow_name']
+    bin_of_day_strs = bydt_df.drop_duplicates('bin_of_day').set_index('bin_of_day')['bin_of_day_str']
+    stats_idx_df = metric_stats['occupancy'].index.to_frame(index=False)
+    stats_idx_df.insert(len(cat_keys) + 1, 'dow_name', stats_idx_df['day_of_week'].map(dow_names))
+    stats_idx_df['bin_of_day_str'] = stats_idx_df['bin_of_day'].map(bin_of_day_strs)
+    stats_idx = pd.MultiIndex.from_frame(stats_idx_df)
+    for stats in metric_stats.values():
+        stats.index = stats_idx
 
-    occ_stats_summary = occ_stats.unstack().reset_index(drop=False)
-    arr_stats_summary = arr_stats.unstack().reset_index(drop=False)
-    dep_stats_summary = dep_stats.unstack().reset_index(drop=False)
+    occ_stats = metric_stats['occupancy']
+    arr_stats = metric_stats['arrivals']
+    dep_stats = metric_stats['departures']
 
-    if verbosity > 1:
-        print(occ_stats_summary.head())
+    if verbosity > 1 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug('occupancy stats:\n%s', occ_stats.head())
+
+    occ_stats_summary = occ_stats.reset_index(drop=False)
+    arr_stats_summary = arr_stats.reset_index(drop=False)
+    dep_stats_summary = dep_stats.reset_index(drop=False)
+
+    if verbosity > 1 and logger.isEnabledFor(logging.DEBUG):
+        logger.debug('occupancy stats summary:\n%s', occ_stats_summary.head())
 
     summaries = {'occupancy': occ_stats_summary, 'arrivals': arr_stats_summary,
                  'departures': dep_stats_summary}
 
-    logger.info(f'Created nonstationary summaries - {catfield}')
+    logger.info('Created nonstationary summaries - %s', catfield)
 
     return summaries
 
@@ -208,18 +221,19 @@ def summarize_stationary(bydt_df: pd.DataFrame, catfield: str | List[str] = None
         fake_key = np.full(len(bydt_df.index), 1)
         bydt_dfgrp = bydt_df.groupby(fake_key)
 
-    occ_stats = bydt_dfgrp['occupancy'].apply(summary_stats, percentiles)
-    arr_stats = bydt_dfgrp['arrivals'].apply(summary_stats, percentiles)
-    dep_stats = bydt_dfgrp['departures'].apply(summary_stats, percentiles)
+    metric_stats = grouped_summary_stats(bydt_dfgrp, ['occupancy', 'arrivals', 'departures'], percentiles)
+    occ_stats = metric_stats['occupancy']
+    arr_stats = metric_stats['arrivals']
+    dep_stats = metric_stats['departures']
 
-    occ_stats_summary = occ_stats.unstack().reset_index(drop=False)
-    arr_stats_summary = arr_stats.unstack().reset_index(drop=False)
-    dep_stats_summary = dep_stats.unstack().reset_index(drop=False)
+    occ_stats_summary = occ_stats.reset_index(drop=False)
+    arr_stats_summary = arr_stats.reset_index(drop=False)
+    dep_stats_summary = dep_stats.reset_index(drop=False)
 
     summaries = {'occupancy': occ_stats_summary, 'arrivals': arr_stats_summary,
                  'departures': dep_stats_summary}
 
-    logger.info(f'Created stationary summaries - {catfield}')
+    logger.info('Created stationary summaries - %s', catfield)
 
     return summaries
 
@@ -258,6 +272,98 @@ def summary_stats(group: DataFrameGroupBy,
     return stats
 
 
+def grouped_summary_stats(grouped: DataFrameGroupBy, metrics: List[str],
+                          percentiles: Tuple[float] | List[float] = (0.25, 0.5, 0.75, 0.95, 0.99),
+                          ):
+    """
+    Compute summary statistics for every group and several columns of a pandas `DataFrameGroupBy` object at once.
+
+    Gives the same statistics as `summary_stats` but uses groupby aggregations over all of the
+    metric columns instead of calling `summary_stats` for each group and column.
+
+    Parameters
+    ----------
+    grouped : pd.DataFrameGroupBy
+        The grouping is by category and/or time bin
+    metrics : list of str
+        Columns to summarize
+    percentiles : list or tuple of floats (e.g. [0.5, 0.75, 0.95]), optional
+        Which percentiles to compute. Default is (0.25, 0.5, 0.75, 0.95, 0.99)
+
+    Returns
+    -------
+    Dict whose keys are the metrics. Dict values are `DataFrame` objects indexed by group with one column
+    per statistic.
+
+    """
+    metrics_grp = grouped[metrics]
+    all_stats = metrics_grp.agg(['count', 'mean', 'min', 'max', 'std', 'sem', 'var', 'skew']).astype(np.float64)
+    if percentiles is not None:
+        all_pctile_vals = metrics_grp.quantile(list(percentiles)).unstack()
+
+    group_ids = grouped.ngroup().to_numpy()
+
+    summaries = {}
+    for metric in metrics:
+        stats = all_stats[metric].rename(columns={'std': 'stdev'})
+        stats['cv'] = np.where(stats['mean'] > 0, stats['stdev'] / stats['mean'], 0)
+        stats['kurt'] = _grouped_kurt(group_ids, grouped.obj[metric].to_numpy(dtype=np.float64),
+                                      stats['count'].to_numpy())
+
+        stat_cols = ['count', 'mean', 'min', 'max', 'stdev', 'sem', 'var', 'cv', 'skew', 'kurt']
+
+        if percentiles is not None:
+            for p in percentiles:
+                pctile_name = pctile_field_name(p)
+                stats[pctile_name] = all_pctile_vals[(metric, p)]
+                stat_cols.append(pctile_name)
+
+        stats.columns.name = None
+        summaries[metric] = stats[stat_cols]
+
+    return summaries
+
+
+def _grouped_kurt(group_ids: np.ndarray, values: np.ndarray, count: np.ndarray):
+    """
+    Unbiased kurtosis of every group, computed the same way as `Series.kurt`.
+
+    Parameters
+    ----------
+    group_ids : ndarray of int
+        Group number of each value, as returned by `GroupBy.ngroup`
+    values : ndarray of float
+    count : ndarray
+        Number of non-missing values in each group
+
+    Returns
+    -------
+    ndarray of kurtosis values in group order
+    """
+    valid = (group_ids >= 0) & ~np.isnan(values)
+    group_ids = group_ids[valid]
+    values = values[valid]
+    num_groups = len(count)
+
+    mean = np.bincount(group_ids, weights=values, minlength=num_groups) / count
+    adjusted2 = (values - mean[group_ids]) ** 2
+    m2 = np.bincount(group_ids, weights=adjusted2, minlength=num_groups)
+    m4 = np.bincount(group_ids, weights=adjusted2 ** 2, minlength=num_groups)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        adj = 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        numerator = count * (count + 1) * (count - 1) * m4
+        denominator = (count - 2) * (count - 3) * m2 ** 2
+
+        # Treat floating point error as zero, as pandas does
+        numerator = np.where(np.abs(numerator) < 1e-14, 0, numerator)
+        denominator = np.where(np.abs(denominator) < 1e-14, 0, denominator)
+        kurt = np.where(denominator == 0, 0, numerator / denominator - adj)
+
+    kurt[count < 4] = np.nan
+    return kurt
+
+
 def summarize_los(stops_preprocessed_df: DataFrame, los_field: str, cat_field: str = None) -> Dict:
     """
     Summarize length of stay.
@@ -300,7 +406,7 @@ def summarize_los(stops_preprocessed_df: DataFrame, los_field: str, cat_field: s
     los_stats_styled = los_stats[cols].style.format(fmt_map)
     # Create los plot
     plot_all = sns.histplot(stops_preprocessed_df, x=los_field)
-    plt.close()  # Supress plot showing up in notebook
+    plt.close(plot_all.figure)  # Supress plot showing up in notebook
 
     # Gather results
     results = {'los_stats': los_stats_styled,
@@ -314,7 +420,7 @@ def summarize_los(stops_preprocessed_df: DataFrame, los_field: str, cat_field: s
         # Create los plot
         g_bycat = sns.FacetGrid(data=stops_preprocessed_df, col=cat_field, sharex=False, sharey=False, col_wrap=3)
         plot_bycat = g_bycat.map(sns.histplot, los_field)
-        plt.close()  # Supress plot showing up in notebook
+        plt.close(plot_bycat.figure)  # Supress plot showing up in notebook
         results['los_stats_bycat'] = los_bycat_stats_styled
         results['los_histo_bycat'] = plot_bycat.figure
 
@@ -361,15 +467,15 @@ def compute_implied_operating_hours(occupancy_summary_df, cat_field=None, statis
     # initialize an empty list
     data = []
 
-    for cat in occ_sum[cat_field].unique():
-        cat_df = occ_sum[occ_sum[cat_field] == cat]
+    # Split by category and day of week in one pass each, in order of first appearance, rather than
+    # scanning the whole frame once per unique value
+    for cat, cat_df in occ_sum.groupby(cat_field, sort=False):
 
-        # iterate over each unique dow_name to fill the data list
-        for day in cat_df['dow_name'].unique():
-            df = cat_df[cat_df['dow_name'] == day]
+        # iterate over each dow_name to fill the data list
+        for day, df in cat_df.groupby('dow_name', sort=False):
 
             # occ_sum['bin_of_day'] = occ_sum.bin_of_day * occ_sum.num_beds
-            df.set_index('bin_of_day', inplace=True)
+            df = df.set_index('bin_of_day')
 
             # remove all rows (bin_of_day) not meeting the cutoff
             df = df[df[statistic] >= cutoff]
@@ -0,0 +1,104 @@
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import hillmaker.bydatetime as bydatetime
+from hillmaker.bydatetime import make_bydatetime
+
+
+def _read_stops():
+    stops_df = pd.read_csv('./tests/fixtures/ssu_2024.csv', parse_dates=['InRoomTS', 'OutRoomTS'])
+    return stops_df[(stops_df['InRoomTS'] < '2024-03-30') & (stops_df['OutRoomTS'] > '2024-01-02')]
+
+
+def _make_bydatetime(stops_df, **kwargs):
+    return make_bydatetime(stops_df, 'InRoomTS', 'OutRoomTS',
+                           np.datetime64('2024-01-02'), np.datetime64('2024-03-29 23:59:59'), **kwargs)
+
+
+def test_concurrent_threaded_calls():
+    # make_bydatetime must be callable from several threads at once. Run in a subprocess so that an
+    # abort in numba's threading layer fails the test instead of the test run. The subprocess ends
+    # with os._exit, as with some TBB builds the interpreter can hang at exit after parallel numba
+    # code ran in a non-main thread, which is unrelated to the concurrent calls being tested.
+    script = textwrap.dedent("""
+        import os
+        import sys
+        from concurrent.futures import ThreadPoolExecutor
+
+        import numpy as np
+        import pandas as pd
+
+        from hillmaker.bydatetime import make_bydatetime
+
+        stops_df = pd.read_csv('./tests/fixtures/ssu_2024.csv', parse_dates=['InRoomTS', 'OutRoomTS'])
+
+        def run(bin_size_minutes):
+            bydt_dfs, _ = make_bydatetime(stops_df, 'InRoomTS', 'OutRoomTS', np.datetime64('2024-01-02'),
+                                          np.datetime64('2024-03-29 23:59:59'), cat_field='PatType',
+                                          bin_size_minutes=bin_size_minutes)
+            return bydt_dfs
+
+        bin_sizes = [60, 30, 60, 30, 120, 15, 60, 30]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            threaded = list(executor.map(run, bin_sizes))
+
+        for bin_size_minutes, bydt_dfs in zip(bin_sizes, threaded):
+            expected_dfs = run(bin_size_minutes)
+            for key in expected_dfs:
+                pd.testing.assert_frame_equal(bydt_dfs[key], expected_dfs[key])
+
+        print('done')
+        sys.stdout.flush()
+        os._exit(0)
+        """)
+
+    try:
+        completed = subprocess.run([sys.executable, '-c', script], capture_output=True, timeout=300)
+    except subprocess.TimeoutExpired:
+        pytest.fail('Concurrent make_bydatetime calls hung')
+
+    assert completed.returncode == 0, completed.stderr.decode()
+    assert completed.stdout.decode().strip() == 'done'
+
+
+@pytest.mark.parametrize('cat_field', ['PatType', None])
+def test_split_categories_match_unsplit(monkeypatch, cat_field):
+    stops_df = _read_stops()
+    unsplit_dfs, _ = _make_bydatetime(stops_df, cat_field=cat_field, bin_size_minutes=30, edge_bins=2)
+
+    # Force the categories to be split into pieces processed by several threads
+    monkeypatch.setattr(bydatetime, 'get_num_threads', lambda: 4)
+    monkeypatch.setattr(bydatetime, 'MIN_STOPS_PER_PIECE', 100)
+    piece_starts, _, _ = bydatetime.split_categories(np.array([0]), np.array([len(stops_df)]), 4, 100)
+    assert len(piece_starts) == 4
+
+    split_dfs, _ = _make_bydatetime(stops_df, cat_field=cat_field, bin_size_minutes=30, edge_bins=2)
+
+    assert unsplit_dfs.keys() == split_dfs.keys()
+    for key in unsplit_dfs:
+        pd.testing.assert_frame_equal(unsplit_dfs[key], split_dfs[key])
+
+
+def test_all_categories_excluded():
+    stops_df = _read_stops()
+    with pytest.raises(ValueError, match='No categories'):
+        _make_bydatetime(stops_df, cat_field='PatType', cat_to_exclude=list(stops_df['PatType'].unique()))
+
+
+def test_non_default_index():
+    # Occupancy weights must follow the stop records, not the index labels of stops_df
+    stops_df = _read_stops().reset_index(drop=True)
+    expected_dfs, _ = _make_bydatetime(stops_df, cat_field='PatType')
+
+    shuffled_df = stops_df.sample(frac=1, random_state=3)
+    shuffled_df.index = shuffled_df.index * 10 + 7
+    bydt_dfs, _ = _make_bydatetime(shuffled_df, cat_field='PatType')
+
+    assert expected_dfs.keys() == bydt_dfs.keys()
+    for key in expected_dfs:
+        pd.testing.assert_frame_equal(expected_dfs[key], bydt_dfs[key])
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from hillmaker.scenario import create_scenario
+
+
+def _make_scenario(export_path, **kwargs):
+    scenario_params = {'scenario_name': 'export_example',
+                       'data': './tests/fixtures/ssu_2024.csv',
+                       'in_field': 'InRoomTS', 'out_field': 'OutRoomTS',
+                       'start_analysis_dt': '2024-01-02', 'end_analysis_dt': '2024-03-30',
+                       'cat_field': 'PatType', 'bin_size_minutes': 60,
+                       'export_bydatetime_csv': True, 'export_summaries_csv': True,
+                       'csv_export_path': export_path, 'make_all_week_plots': False}
+    scenario_params.update(kwargs)
+    return create_scenario(scenario_params)
+
+
+def test_export_csv_default(tmp_path):
+    scenario = _make_scenario(tmp_path)
+    assert scenario.export_format.value == 'csv'
+
+    scenario.make_hills()
+
+    assert (tmp_path / 'export_example_bydatetime_datetime.csv').exists()
+    assert (tmp_path / 'export_example_bydatetime_PatType_datetime.csv').exists()
+    assert (tmp_path / 'export_example_occupancy_PatType_dow_binofday.csv').exists()
+    assert not list(tmp_path.glob('*.parquet'))
+
+
+def test_export_parquet_roundtrip(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    scenario = _make_scenario(tmp_path, export_format='parquet')
+    scenario.make_hills()
+
+    assert not list(tmp_path.glob('*.csv'))
+
+    bydatetime_df = scenario.get_bydatetime_df(by_category=True)
+    bydatetime_parquet_df = pd.read_parquet(tmp_path / 'export_example_bydatetime_PatType_datetime.parquet')
+    pd.testing.assert_frame_equal(bydatetime_parquet_df, bydatetime_df[bydatetime_parquet_df.columns])
+
+    occ_summary_df = scenario.hills['summaries']['nonstationary']['PatType_dow_binofday']['occupancy']
+    occ_summary_parquet_df = pd.read_parquet(tmp_path / 'export_example_occupancy_PatType_dow_binofday.parquet')
+    pd.testing.assert_frame_equal(occ_summary_parquet_df, occ_summary_df)
+
+
+def test_export_both(tmp_path):
+    pytest.importorskip('pyarrow')
+
+    scenario = _make_scenario(tmp_path, export_format='both')
+    scenario.make_hills()
+
+    csv_stems = {p.stem for p in tmp_path.glob('*.csv')}
+    parquet_stems = {p.stem for p in tmp_path.glob('*.parquet')}
+    assert 'export_example_bydatetime_PatType_datetime' in csv_stems
+    assert csv_stems == parquet_stems
@@ -556,6 +556,45 @@ def test_left_mbins_boundary():
     assert isclose(bydatetime_df['occupancy'].sum(), (len(occ_series) * 30) / 30)
 
 
+def test_left_onebin_secondsbefore():
+    # Create test case
+
+    scenario_name = 'test_left_onebin_secondsbefore'
+    bin_size_minutes = 30
+    start_analysis_dt = pd.Timestamp('2024-01-01')
+    end_analysis_dt = pd.Timestamp('2024-01-01')
+    stop_record = {'InRoomTS': pd.Timestamp('2023-12-31 23:59:30'),
+                   'OutRoomTS': pd.Timestamp('2024-01-01 0:20')}
+
+    stops_df = pd.DataFrame({k: [v] for k, v in stop_record.items()})
+
+    scenario_params = {'scenario_name': scenario_name,
+                       'data': stops_df,
+                       'in_field': 'InRoomTS', 'out_field': 'OutRoomTS',
+                       'start_analysis_dt': start_analysis_dt,
+                       'end_analysis_dt': end_analysis_dt,
+                       'bin_size_minutes': bin_size_minutes}
+
+    # Create scenario and run hillmaker
+    scenario = create_scenario(scenario_params)
+    scenario.compute_hills_stats()
+    bydatetime_df = scenario.get_bydatetime_df(by_category=False)
+
+    # Check results
+
+    # Arrival is just before the start of the analysis range and must not be counted
+    assert bydatetime_df['arrivals'].sum() == 0.0
+
+    # Departure bin and total number of departures
+    assert bydatetime_df.loc[pd.Timestamp('2024-01-01 0:00')]['departures'] == 1.0
+    assert bydatetime_df['departures'].sum() == 1.0
+
+    # Occupancy in relevant bins and total occupancy - only the part inside the analysis range
+    assert isclose(bydatetime_df.loc[pd.Timestamp('2024-01-01 0:00')]['occupancy'], 20 / 30)
+
+    assert isclose(bydatetime_df['occupancy'].sum(), 20 / 30)
+
+
 def test_right_mbins_lfrac():
     # Create test case
 
@@ -644,6 +683,46 @@ def test_right_mbins_boundary():
     assert isclose(bydatetime_df['occupancy'].sum(), (len(occ_series) * 30 + 10) / 30)
 
 
+def test_inner_lastbin_lastsecond():
+    # Create test case
+
+    scenario_name = 'test_inner_lastbin_lastsecond'
+    bin_size_minutes = 30
+    start_analysis_dt = pd.Timestamp('2024-01-01')
+    end_analysis_dt = pd.Timestamp('2024-01-01')
+    stop_record = {'InRoomTS': pd.Timestamp('2024-01-01 23:40'),
+                   'OutRoomTS': pd.Timestamp('2024-01-01 23:59:59')}
+
+    stops_df = pd.DataFrame({k: [v] for k, v in stop_record.items()})
+
+    scenario_params = {'scenario_name': scenario_name,
+                       'data': stops_df,
+                       'in_field': 'InRoomTS', 'out_field': 'OutRoomTS',
+                       'start_analysis_dt': start_analysis_dt,
+                       'end_analysis_dt': end_analysis_dt,
+                       'bin_size_minutes': bin_size_minutes}
+
+    # Create scenario and run hillmaker
+    scenario = create_scenario(scenario_params)
+    scenario.compute_hills_stats()
+    bydatetime_df = scenario.get_bydatetime_df(by_category=False)
+
+    # Check results
+
+    # Arrival bin and total number of arrivals
+    assert bydatetime_df.loc[pd.Timestamp('2024-01-01 23:30')]['arrivals'] == 1.0
+    assert bydatetime_df['arrivals'].sum() == 1.0
+
+    # Departure at the end of the analysis range, in the final second of the last bin, is counted
+    assert bydatetime_df.loc[pd.Timestamp('2024-01-01 23:30')]['departures'] == 1.0
+    assert bydatetime_df['departures'].sum() == 1.0
+
+    # Occupancy in relevant bins and total occupancy
+    assert isclose(bydatetime_df.loc[pd.Timestamp('2024-01-01 23:30')]['occupancy'], (19 + 59 / 60) / 30)
+
+    assert isclose(bydatetime_df['occupancy'].sum(), (19 + 59 / 60) / 30)
+
+
 def test_outer_mbins_boundary():
     # Create test case
 
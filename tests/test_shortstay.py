@@ -72,3 +72,5 @@ def test_shortstay():
     assert [k for k in hills.keys()] == [k for k in scenario_1.hills.keys()]
     assert [k for k in hills.keys()] == [k for k in hills_nocat.keys()]
 
+    # settings record the analysis span, with the end date extended to the end of the day
+    assert hills['settings']['end_analysis_dt'] == pd.Timestamp('2024-03-30 23:59:59')